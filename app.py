@@ -7,26 +7,54 @@ Uses RapidAPI Instagram Scraper for reliable cloud-based downloading.
 import os
 import sys
 import uuid
-import json
 import shutil
-import zipfile
+import heapq
+import struct
+import zlib
 import threading
 import time
-import random
 import re
+import orjson
 import requests as http_requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from datetime import datetime, timedelta
-from flask import Flask, render_template, request, jsonify, Response, send_file, stream_with_context
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 
 app = Flask(__name__)
 app.secret_key = os.urandom(24)
 
+# Lookups read `tasks` directly; tasks_lock guards the expiry heap and task
+# inserts/deletes. Each task has its own condition for its fields.
 tasks = {}
 tasks_lock = threading.Lock()
+# (expires_at, task_id) min-heap
+task_expiry_heap = []
+
+# Raw RapidAPI responses by (endpoint, params), so repeat downloads of the
+# same profile within the TTL spend no API quota
+api_cache = {}
+api_cache_lock = threading.Lock()
 
 TASK_TTL_SECONDS = 1800
+CLEANUP_INTERVAL_SECONDS = 60
+API_CACHE_TTL_SECONDS = 600
 DOWNLOAD_DIR = Path("/tmp/insta_downloads")
+ZIP_STREAM_CHUNK = 1024 * 1024
+DOWNLOAD_CHUNK = 1024 * 1024
+SSE_KEEPALIVE_SECONDS = 15
+MAX_TASK_MESSAGES = 512
+# Concurrent CDN downloads per task
+DOWNLOAD_WORKERS = int(os.environ.get("DL_WORKERS", "8"))
+# Request rates shared by every task in the process (requests per second)
+API_RATE = float(os.environ.get("API_RPS", "5"))
+CDN_RATE = float(os.environ.get("CDN_RPS", "20"))
+# 429s are retried by us, through the limiters, not by urllib3
+THROTTLE_RETRIES = 3
+
+DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
 
 # RapidAPI configuration
 RAPIDAPI_KEY = os.environ.get("RAPIDAPI_KEY", "")
@@ -35,6 +63,92 @@ RAPIDAPI_KEY = os.environ.get("RAPIDAPI_KEY", "")
 RAPIDAPI_HOST = "instagram-scraper-api2.p.rapidapi.com"
 RAPIDAPI_BASE = f"https://{RAPIDAPI_HOST}/v1"
 
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+
+# Characters that are not allowed in filenames, mapped to "_"
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*\n\r'})
+_MULTI_UNDERSCORE_RE = re.compile(r'_+')
+# Hashtags are whole words starting with '#'
+_HASHTAG_RE = re.compile(r'(?<!\S)#\S*')
+_WS_RE = re.compile(r'\s+')
+
+# A profile URL, or "@name" / "name"; only Instagram's username charset is
+# accepted, and a bare host never passes for a username
+_USERNAME_RE = re.compile(
+    r'^(?:'
+    r'(?:https?://)?(?:(?:www|m)\.)?instagram\.com/@?([A-Za-z0-9._]+)'
+    r'|(?!(?:(?:www|m)\.)?instagram\.com(?:[/?#]|$))@?([A-Za-z0-9._]+)'
+    r')(?:[/?#].*)?$'
+)
+
+
+class TokenBucket:
+    """Thread-safe token bucket: acquire() blocks until a request may be sent."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self._successes = 0
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            # Sleep outside the lock so other threads can refill and check too
+            time.sleep(wait)
+
+    def observe(self, status_code: int):
+        """Halve the rate on a 429; double it back after 10 successes in a row."""
+        with self._lock:
+            if status_code == 429:
+                self.rate = max(self.max_rate / 32, self.rate / 2)
+                self._successes = 0
+                # Spend the saved-up burst so the next request waits at the new rate
+                self._tokens = min(self._tokens, 0.0)
+            elif status_code < 400 and self.rate < self.max_rate:
+                self._successes += 1
+                if self._successes >= 10:
+                    self.rate = min(self.max_rate, self.rate * 2)
+                    self._successes = 0
+
+
+# RapidAPI quota is per key, so one bucket covers all tasks; the CDN gets its own
+api_limiter = TokenBucket(rate=API_RATE, capacity=10)
+cdn_limiter = TokenBucket(rate=CDN_RATE, capacity=DOWNLOAD_WORKERS)
+
+
+def _discard_part(future):
+    """Done-callback that deletes the part file of a download nobody will collect."""
+    if not future.cancelled() and future.result():
+        future.result()[0].unlink(missing_ok=True)
+
+
+def _make_session() -> http_requests.Session:
+    """Create a pooled HTTP session that retries transient API/CDN failures."""
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,
+        # No 429: those must reach the shared limiters (see _limited_get)
+        status_forcelist=[500, 502, 503, 504],
+        # Hand the final error response back so callers can inspect the status
+        raise_on_status=False,
+    )
+    session = http_requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=retry))
+    # RapidAPI headers stay per-request so the key is never sent to the CDN
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
 
 class WebReelDownloader:
     """Downloads Instagram reels using RapidAPI Instagram Scraper."""
@@ -44,50 +158,164 @@ class WebReelDownloader:
         self.task_dir = DOWNLOAD_DIR / task_id
         self.videos_dir = self.task_dir / "videos"
         self.videos_dir.mkdir(parents=True, exist_ok=True)
+        self.session = _make_session()
+
+    def _task(self):
+        # dict.get is atomic under the GIL; tasks_lock only serializes inserts/deletes
+        return tasks.get(self.task_id)
+
+    def _commit(self, msg: str = None, **fields):
+        """Append a message and/or update task fields in one lock acquisition."""
+        task = self._task()
+        if task:
+            with task["cond"]:
+                if msg:
+                    task["msg_seq"] += 1
+                    task["messages"].append((task["msg_seq"], msg))
+                task.update(fields)
+                # Wake every progress stream waiting on this task
+                task["cond"].notify_all()
 
     def _update(self, **kwargs):
-        with tasks_lock:
-            if self.task_id in tasks:
-                tasks[self.task_id].update(kwargs)
+        self._commit(**kwargs)
 
     def _add_message(self, msg: str):
-        with tasks_lock:
-            if self.task_id in tasks:
-                tasks[self.task_id]["messages"].append(msg)
+        self._commit(msg)
 
     def sanitize_filename(self, filename: str) -> str:
-        invalid_chars = '<>:"/\\|?*\n\r'
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
-        filename = re.sub(r'_+', '_', filename)
-        if len(filename) > 150:
-            filename = filename[:150]
-        return filename.strip(' _')
+        return _MULTI_UNDERSCORE_RE.sub('_', filename.translate(_SANITIZE_TABLE))[:150].strip(' _')
+
+    def _limited_get(self, limiter: TokenBucket, url: str, **kwargs):
+        """GET paced by a shared limiter; a 429 slows the limiter and is retried through it."""
+        for attempt in range(THROTTLE_RETRIES + 1):
+            limiter.acquire()
+            resp = self.session.get(url, **kwargs)
+            limiter.observe(resp.status_code)
+            if resp.status_code != 429 or attempt == THROTTLE_RETRIES:
+                return resp
+            resp.close()
 
     def _api_request(self, endpoint: str, params: dict = None):
-        """Make a request to the RapidAPI Instagram Scraper."""
+        """Make a request to the RapidAPI Instagram Scraper, reusing recent responses."""
+        params = params or {}
+        cache_key = (endpoint, tuple(sorted(params.items())))
+        now = time.monotonic()
+        with api_cache_lock:
+            cached = api_cache.get(cache_key)
+        if cached and now - cached[0] < API_CACHE_TTL_SECONDS:
+            return orjson.loads(cached[1])
+
         headers = {
             "x-rapidapi-key": RAPIDAPI_KEY,
             "x-rapidapi-host": RAPIDAPI_HOST,
         }
         url = f"{RAPIDAPI_BASE}/{endpoint}"
-        resp = http_requests.get(url, headers=headers, params=params or {}, timeout=30)
+        resp = self._limited_get(api_limiter, url, headers=headers, params=params, timeout=30)
+        # Errors (429/5xx included) raise here, so only successes are cached
         resp.raise_for_status()
-        return resp.json()
+
+        # Expired entries are pruned by the janitor, not on this path
+        with api_cache_lock:
+            api_cache[cache_key] = (now, resp.content)
+        return orjson.loads(resp.content)
+
+    def _parse_reel(self, i: int, reel: dict):
+        """Return (video_url, reel_id, clean_title, caption_text) for a reel from the API."""
+        # Extract video URL from reel data
+        video_url = None
+
+        # Try different possible structures
+        video_versions = reel.get("video_versions", [])
+        if video_versions:
+            # Get highest quality
+            video_url = video_versions[0].get("url")
+        elif reel.get("video_url"):
+            video_url = reel["video_url"]
+
+        if not video_url:
+            # Try nested structure
+            media = reel.get("media", {})
+            video_versions = media.get("video_versions", [])
+            if video_versions:
+                video_url = video_versions[0].get("url")
+
+        # Get caption
+        caption_data = reel.get("caption", {})
+        if isinstance(caption_data, dict):
+            caption_text = caption_data.get("text", "")
+        elif isinstance(caption_data, str):
+            caption_text = caption_data
+        else:
+            caption_text = ""
+
+        # Create filename
+        if caption_text:
+            # First line without hashtags, whitespace runs collapsed
+            first_line = caption_text.partition('\n')[0]
+            first_line = _WS_RE.sub(' ', _HASHTAG_RE.sub('', first_line)).strip()[:80]
+            clean_title = self.sanitize_filename(first_line)
+        else:
+            clean_title = ""
+
+        reel_id = self.sanitize_filename(str(reel.get("code") or reel.get("pk") or reel.get("id", f"reel_{i+1}")))
+        if not clean_title:
+            clean_title = reel_id
+
+        return video_url, reel_id, clean_title, caption_text
+
+    def _download_one(self, i: int, video_url: str, filename: str, clean_title: str):
+        """Download one reel into a part file in the task dir; returns (path, size, crc) or None."""
+        # Kept outside videos/ so an interrupted download never ends up in the zip
+        part_path = self.task_dir / f"{filename}.part"
+        try:
+            self._add_message(f"⬇️ [{i+1}] {clean_title[:40]}...")
+
+            # Download video directly from Instagram CDN
+            try:
+                with self._limited_get(cdn_limiter, video_url, stream=True, timeout=60) as vid_resp:
+                    vid_resp.raise_for_status()
+
+                    # Copy the raw stream in large blocks rather than 8 KiB chunks,
+                    # taking the CRC the zip headers need on the way through
+                    vid_resp.raw.decode_content = True
+                    crc = 0
+                    with open(part_path, "wb") as f:
+                        while True:
+                            chunk = vid_resp.raw.read(DOWNLOAD_CHUNK)
+                            if not chunk:
+                                break
+                            f.write(chunk)
+                            crc = zlib.crc32(chunk, crc)
+                        size = f.tell()
+            except http_requests.exceptions.RequestException as e:
+                part_path.unlink(missing_ok=True)
+                self._add_message(f"❌ [{i+1}] Download failed: {str(e)[:50]}")
+                return None
+
+            if size <= 1000:
+                part_path.unlink(missing_ok=True)
+                self._add_message(f"❌ [{i+1}] File too small, skipped")
+                return None
+
+            return part_path, size, crc
+
+        except Exception as e:
+            part_path.unlink(missing_ok=True)
+            self._add_message(f"❌ Error on reel {i+1}: {str(e)[:60]}")
+            return None
 
     def download_reels(self, username: str, ig_username: str = None, ig_password: str = None):
         """Download all reels from a profile using RapidAPI."""
         try:
             if not RAPIDAPI_KEY:
-                self._update(
+                self._commit(
+                    "❌ No API key! Add RAPIDAPI_KEY in Render settings.",
                     status="error",
                     error="RapidAPI key not configured. Set RAPIDAPI_KEY environment variable on Render.",
                 )
-                self._add_message("❌ No API key! Add RAPIDAPI_KEY in Render settings.")
                 return
 
-            self._update(status="fetching", progress=5)
-            self._add_message(f"🔍 Fetching reels from @{username}...")
+            self._commit(f"🔍 Fetching reels from @{username}...", status="fetching", progress=5)
             self._add_message("📡 Using RapidAPI Instagram Scraper (no IP blocking)...")
 
             # Step 1: Get user info to get user_id
@@ -96,16 +324,25 @@ class WebReelDownloader:
                 info_data = self._api_request("info", {"username_or_id_or_url": username})
             except http_requests.exceptions.HTTPError as e:
                 if e.response.status_code == 404:
-                    self._update(status="error", error=f"Profile @{username} not found.")
-                    self._add_message(f"❌ @{username} not found!")
+                    self._commit(
+                        f"❌ @{username} not found!",
+                        status="error",
+                        error=f"Profile @{username} not found.",
+                    )
                     return
                 elif e.response.status_code == 429:
-                    self._update(status="error", error="API rate limit reached. Try again in a few minutes.")
-                    self._add_message("❌ API rate limit. Wait a minute and retry.")
+                    self._commit(
+                        "❌ API rate limit. Wait a minute and retry.",
+                        status="error",
+                        error="API rate limit reached. Try again in a few minutes.",
+                    )
                     return
                 elif e.response.status_code == 403:
-                    self._update(status="error", error="Invalid API key. Check RAPIDAPI_KEY env variable.")
-                    self._add_message("❌ Invalid API key!")
+                    self._commit(
+                        "❌ Invalid API key!",
+                        status="error",
+                        error="Invalid API key. Check RAPIDAPI_KEY env variable.",
+                    )
                     return
                 raise
 
@@ -115,212 +352,328 @@ class WebReelDownloader:
             is_private = user_data.get("is_private", False)
 
             if is_private:
-                self._update(status="error", error=f"@{username} is a private account. Reels cannot be downloaded.")
-                self._add_message(f"🔒 @{username} is private!")
+                self._commit(
+                    f"🔒 @{username} is private!",
+                    status="error",
+                    error=f"@{username} is a private account. Reels cannot be downloaded.",
+                )
                 return
 
             self._add_message(f"✅ Found: {full_name} (@{username})")
 
-            # Step 2: Fetch reels
-            self._add_message("📊 Scanning reels...")
-            self._update(status="scanning", progress=15)
+            # Step 2: Fetch reels, starting downloads as each page arrives so
+            # listing a large profile overlaps with fetching the reels found so far
+            self._commit("📊 Scanning reels...", status="scanning", progress=15)
 
-            all_reels = []
+            captions = {}
+            # (name, size, crc, mtime) of every file that goes into the zip
+            zip_entries = []
+            downloaded = 0
+            total_reels = 0
+            # Files are named by reel code, so a reel is saved under the same
+            # name no matter what its caption says. videos/ is new for every
+            # task, so this only catches codes repeated within the listing.
+            saved_names = set()
+
+            pool = ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS)
+            futures = {}
+            pending = set()
+            finished = 0
+            # Listing holds the bar in the 15-20 band; finished/total only maps
+            # onto 20-90 once the total is final. Never move it backwards.
+            progress = 15
+            listing = True
             pagination_token = None
             page = 0
 
-            while True:
-                page += 1
-                params = {"username_or_id_or_url": username}
-                if pagination_token:
-                    params["pagination_token"] = pagination_token
-
-                try:
-                    reels_data = self._api_request("reels", params)
-                except http_requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 429:
-                        self._add_message(f"⚠️ Rate limited after finding {len(all_reels)} reels. Downloading what we have...")
-                        break
-                    raise
-
-                items = reels_data.get("data", {}).get("items", [])
-                if not items:
-                    break
+            def collect(future):
+                # Move a finished download into videos/ and report it
+                nonlocal downloaded, finished, progress
+                pending.discard(future)
+                finished += 1
+                low, span = (15, 5) if listing else (20, 70)
+                progress = max(progress, low + int((finished / len(futures)) * span))
+                filename, clean_title = futures[future]
+
+                result = future.result()
+                if not result:
+                    captions.pop(filename, None)
+                    self._update(progress=progress)
+                    return
 
-                all_reels.extend(items)
-                self._add_message(f"📹 Found {len(all_reels)} reels so far... (page {page})")
+                # os.replace: the reel appears under its final name only once complete
+                part_path, size, crc = result
+                os.replace(part_path, self.videos_dir / filename)
+                zip_entries.append((filename, size, crc, time.time()))
+                downloaded += 1
+                self._commit(f"✅ Downloaded: {clean_title[:40]}", downloaded=downloaded, progress=progress)
 
-                pagination_token = reels_data.get("pagination_token")
-                if not pagination_token:
-                    break
+            try:
+                while True:
+                    page += 1
+                    params = {"username_or_id_or_url": username}
+                    if pagination_token:
+                        params["pagination_token"] = pagination_token
 
-                # Small delay between pagination requests
-                time.sleep(1)
+                    try:
+                        reels_data = self._api_request("reels", params)
+                    except http_requests.exceptions.HTTPError as e:
+                        if e.response.status_code == 429:
+                            self._add_message(f"⚠️ Rate limited after finding {total_reels} reels. Downloading what we have...")
+                            break
+                        raise
+
+                    items = reels_data.get("data", {}).get("items", [])
+                    if not items:
+                        break
 
-            if not all_reels:
-                self._update(status="error", error=f"No reels found for @{username}.")
-                self._add_message("❌ No reels found!")
-                return
+                    for reel in items:
+                        i = total_reels
+                        total_reels += 1
+                        try:
+                            video_url, reel_id, clean_title, caption_text = self._parse_reel(i, reel)
+                        except Exception as e:
+                            self._add_message(f"❌ Error on reel {i+1}: {str(e)[:60]}")
+                            continue
+
+                        if not video_url:
+                            self._add_message(f"⏭️ [{i+1}] No video URL, skipping...")
+                            continue
+
+                        filename = f"{reel_id}.mp4"
+
+                        # Skip duplicates; the first copy is the one counted
+                        if filename in saved_names:
+                            self._add_message(f"⏭️ [{i+1}] Duplicate in listing, skipping: {clean_title[:40]}")
+                            continue
+                        saved_names.add(filename)
+
+                        future = pool.submit(self._download_one, i, video_url, filename, clean_title)
+                        futures[future] = (filename, clean_title)
+                        # Save caption, with the title it would have been named after.
+                        # Added in listing order so the caption files follow the
+                        # profile, not download completion; dropped if it fails.
+                        if caption_text:
+                            captions[filename] = {"title": clean_title, "caption": caption_text}
+                        pending.add(future)
+
+                    self._commit(f"📹 Found {total_reels} reels so far... (page {page})", total=total_reels)
+
+                    # Report reels that finished while this page was being fetched
+                    for future in [f for f in pending if f.done()]:
+                        collect(future)
+
+                    pagination_token = reels_data.get("pagination_token")
+                    if not pagination_token:
+                        break
 
-            total_reels = len(all_reels)
-            self._add_message(f"📹 Total: {total_reels} reels. Starting download...")
-            self._update(status="downloading", total=total_reels, downloaded=0, progress=20)
+                if not total_reels:
+                    self._commit("❌ No reels found!", status="error", error=f"No reels found for @{username}.")
+                    return
 
-            captions = {}
-            downloaded = 0
+                listing = False
+                progress = max(progress, 20 + int((finished / len(futures)) * 70)) if futures else 20
+                self._commit(
+                    f"📹 Total: {total_reels} reels. Finishing downloads...",
+                    status="downloading",
+                    total=total_reels,
+                    progress=progress,
+                )
 
-            for i, reel in enumerate(all_reels):
-                try:
-                    # Extract video URL from reel data
-                    video_url = None
-
-                    # Try different possible structures
-                    video_versions = reel.get("video_versions", [])
-                    if video_versions:
-                        # Get highest quality
-                        video_url = video_versions[0].get("url")
-                    elif reel.get("video_url"):
-                        video_url = reel["video_url"]
-
-                    if not video_url:
-                        # Try nested structure
-                        media = reel.get("media", {})
-                        video_versions = media.get("video_versions", [])
-                        if video_versions:
-                            video_url = video_versions[0].get("url")
-
-                    if not video_url:
-                        self._add_message(f"⏭️ [{i+1}/{total_reels}] No video URL, skipping...")
-                        continue
-
-                    # Get caption
-                    caption_data = reel.get("caption", {})
-                    if isinstance(caption_data, dict):
-                        caption_text = caption_data.get("text", "")
-                    elif isinstance(caption_data, str):
-                        caption_text = caption_data
-                    else:
-                        caption_text = ""
-
-                    # Create filename
-                    if caption_text:
-                        first_line = caption_text.split('\n')[0]
-                        first_line = ' '.join(w for w in first_line.split() if not w.startswith('#'))
-                        if len(first_line) > 80:
-                            first_line = first_line[:80]
-                        clean_title = self.sanitize_filename(first_line)
-                    else:
-                        clean_title = ""
-
-                    reel_id = reel.get("code") or reel.get("pk") or reel.get("id", f"reel_{i+1}")
-                    if not clean_title:
-                        clean_title = str(reel_id)
-
-                    filename = f"{clean_title}.mp4"
-                    filepath = self.videos_dir / filename
-
-                    # Skip duplicates
-                    if filepath.exists():
-                        downloaded += 1
-                        self._add_message(f"⏭️ [{i+1}/{total_reels}] Already exists: {clean_title[:40]}")
-                        continue
-
-                    self._add_message(f"⬇️ [{i+1}/{total_reels}] {clean_title[:40]}...")
-                    progress = 20 + int((i / total_reels) * 70)
-                    self._update(downloaded=downloaded, progress=progress)
-
-                    # Download video directly from Instagram CDN
-                    try:
-                        vid_resp = http_requests.get(
-                            video_url,
-                            stream=True,
-                            timeout=60,
-                            headers={"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"},
-                        )
-                        vid_resp.raise_for_status()
-
-                        with open(filepath, "wb") as f:
-                            for chunk in vid_resp.iter_content(chunk_size=8192):
-                                f.write(chunk)
-
-                        if filepath.exists() and filepath.stat().st_size > 1000:
-                            downloaded += 1
-                            self._add_message(f"✅ Downloaded: {clean_title[:40]}")
-
-                            # Save caption
-                            if caption_text:
-                                captions[filename] = caption_text
-                        else:
-                            filepath.unlink(missing_ok=True)
-                            self._add_message(f"❌ [{i+1}] File too small, skipped")
-
-                    except http_requests.exceptions.RequestException as e:
-                        self._add_message(f"❌ [{i+1}] Download failed: {str(e)[:50]}")
-                        continue
-
-                    # Small delay between downloads
-                    time.sleep(random.uniform(0.5, 1.5))
-
-                except Exception as e:
-                    self._add_message(f"❌ Error on reel {i+1}: {str(e)[:60]}")
-                    continue
+                for future in as_completed(list(pending)):
+                    collect(future)
+            except Exception:
+                # Report the error without waiting on the pool: queued downloads
+                # are cancelled below, ones in flight finish in the background
+                # and their part files are deleted as they do
+                for future in pending:
+                    future.add_done_callback(_discard_part)
+                raise
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
 
             if downloaded == 0:
-                self._update(status="error", error="Could not download any reels. Video URLs may have expired. Try again.")
-                self._add_message("❌ No reels downloaded!")
+                self._commit(
+                    "❌ No reels downloaded!",
+                    status="error",
+                    error="Could not download any reels. Video URLs may have expired. Try again.",
+                )
                 return
 
             # Save captions
             if captions:
-                captions_path = self.videos_dir / "captions.json"
-                with open(captions_path, "w", encoding="utf-8") as f:
-                    json.dump(captions, f, indent=2, ensure_ascii=False)
-
-                txt_path = self.videos_dir / "captions.txt"
-                with open(txt_path, "w", encoding="utf-8") as f:
-                    for fname, caption in captions.items():
-                        f.write(f"{'='*60}\n📹 {fname}\n{'='*60}\n{caption}\n\n")
-
-            # Create zip
-            self._add_message(f"📦 Zipping {downloaded} videos...")
-            self._update(status="zipping", progress=95)
-
-            zip_path = self.task_dir / f"{username}_reels.zip"
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                for file in self.videos_dir.iterdir():
-                    zf.write(file, file.name)
-
-            zip_size_mb = zip_path.stat().st_size / (1024 * 1024)
-            self._add_message(f"✨ Done! {downloaded}/{total_reels} reels ({zip_size_mb:.1f} MB)")
-            self._update(
+                sep = "=" * 60
+                body = "".join(
+                    f"{sep}\n📹 {fname} — {entry['title']}\n{sep}\n{entry['caption']}\n\n"
+                    for fname, entry in captions.items()
+                )
+                for name, data in (
+                    ("captions.json", orjson.dumps(captions, option=orjson.OPT_INDENT_2)),
+                    ("captions.txt", body.encode("utf-8")),
+                ):
+                    (self.videos_dir / name).write_bytes(data)
+                    zip_entries.append((name, len(data), zlib.crc32(data), time.time()))
+
+            # The zip is streamed by /download/<task_id>; everything in it is
+            # sized up front, so this is its exact length. Videos go first.
+            zip_entries.sort(key=lambda e: (not e[0].endswith(".mp4"), e[0]))
+            zip_size_mb = zip_layout(zip_entries)[1] / (1024 * 1024)
+            # The TTL counts from when the zip became available, not from the start
+            _extend_expiry(self.task_id)
+            self._commit(
+                f"✨ Done! {downloaded}/{total_reels} reels ({zip_size_mb:.1f} MB)",
                 status="done",
                 progress=100,
                 downloaded=downloaded,
-                zip_path=str(zip_path),
+                videos_dir=str(self.videos_dir),
+                zip_entries=zip_entries,
                 zip_size=f"{zip_size_mb:.1f}",
                 zip_filename=f"{username}_reels.zip",
             )
 
         except http_requests.exceptions.RequestException as e:
-            self._update(status="error", error=f"API error: {str(e)[:150]}")
-            self._add_message(f"❌ API error: {str(e)[:100]}")
+            self._commit(f"❌ API error: {str(e)[:100]}", status="error", error=f"API error: {str(e)[:150]}")
         except Exception as e:
-            self._update(status="error", error=str(e)[:200])
-            self._add_message(f"❌ Error: {str(e)[:100]}")
+            self._commit(f"❌ Error: {str(e)[:100]}", status="error", error=str(e)[:200])
+        finally:
+            self.session.close()
+
+
+# Sizes and offsets past this need ZIP64 fields (the same cut-off zipfile uses)
+_ZIP64_LIMIT = (1 << 31) - 1
+_ZIP_MAX_ENTRIES = 0xFFFF
+_ZIP_UTF8_FLAG = 0x800
+
+
+def _dos_datetime(mtime: float):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2,
+        (t.tm_year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday,
+    )
+
+
+def zip_layout(entries):
+    """Plan a ZIP_STORED archive of (name, size, crc, mtime) entries.
+
+    The CRC and size of every file are known up front, so the local headers
+    carry them (no data descriptors) and the archive length is exact. Returns
+    (parts, length): parts are header bytes, or (name, size) for file contents.
+    """
+    parts = []
+    central = []
+    offset = 0
+    for name, size, crc, mtime in entries:
+        encoded = name.encode("utf-8")
+        dostime, dosdate = _dos_datetime(mtime)
+        large = size > _ZIP64_LIMIT
+
+        extra = struct.pack("<HHQQ", 0x0001, 16, size, size) if large else b""
+        stored_size = 0xFFFFFFFF if large else size
+        local = struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, 45 if large else 20, _ZIP_UTF8_FLAG, 0,
+            dostime, dosdate, crc, stored_size, stored_size, len(encoded), len(extra),
+        ) + encoded + extra
+        parts.append(local)
+        parts.append((name, size))
+
+        # The central record's ZIP64 extra holds only the fields that overflow
+        fields = [size, size] if large else []
+        if offset > _ZIP64_LIMIT:
+            fields.append(offset)
+        extra = struct.pack(f"<HH{len(fields)}Q", 0x0001, 8 * len(fields), *fields) if fields else b""
+        version = 45 if fields else 20
+        central.append(struct.pack(
+            "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, _ZIP_UTF8_FLAG, 0,
+            dostime, dosdate, crc, stored_size, stored_size, len(encoded), len(extra), 0, 0, 0,
+            0o100644 << 16, 0xFFFFFFFF if offset > _ZIP64_LIMIT else offset,
+        ) + encoded + extra)
+        offset += len(local) + size
+
+    directory = b"".join(central)
+    count = len(entries)
+    end = b""
+    if count >= _ZIP_MAX_ENTRIES or offset > _ZIP64_LIMIT or len(directory) > _ZIP64_LIMIT:
+        end += struct.pack(
+            "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, len(directory), offset,
+        )
+        end += struct.pack("<IIQI", 0x07064B50, 0, offset + len(directory), 1)
+    end += struct.pack(
+        "<IHHHHIIH", 0x06054B50, 0, 0, min(count, 0xFFFF), min(count, 0xFFFF),
+        min(len(directory), 0xFFFFFFFF), min(offset, 0xFFFFFFFF), 0,
+    )
+    parts.append(directory + end)
+    return parts, offset + len(directory) + len(end)
+
+
+def stream_zip(directory: Path, parts):
+    """Yield the archive planned by zip_layout, reading file contents from directory."""
+    for part in parts:
+        if isinstance(part, bytes):
+            yield part
+            continue
+        name, size = part
+        with open(directory / name, "rb") as src:
+            # Never send more than was promised in the headers and Content-Length
+            remaining = size
+            while remaining:
+                chunk = src.read(min(ZIP_STREAM_CHUNK, remaining))
+                if not chunk:
+                    raise OSError(f"{name} is shorter than its zip entry")
+                remaining -= len(chunk)
+                yield chunk
+
+
+def _extend_expiry(task_id: str):
+    """Push a task's deletion back to a full TTL from now."""
+    with tasks_lock:
+        task = tasks.get(task_id)
+        if task:
+            task["expires"] = time.monotonic() + TASK_TTL_SECONDS
+            heapq.heappush(task_expiry_heap, (task["expires"], task_id))
 
 
 def cleanup_old_tasks():
-    now = datetime.now()
+    # Pop only the tasks whose deadline has passed instead of scanning them all
+    now = time.monotonic()
+    expired = []
     with tasks_lock:
-        expired = [
-            tid for tid, t in tasks.items()
-            if now - t.get("created", now) > timedelta(seconds=TASK_TTL_SECONDS)
-        ]
-        for tid in expired:
-            task_dir = DOWNLOAD_DIR / tid
-            if task_dir.exists():
-                shutil.rmtree(task_dir, ignore_errors=True)
+        while task_expiry_heap and task_expiry_heap[0][0] <= now:
+            _, tid = heapq.heappop(task_expiry_heap)
+            task = tasks.get(tid)
+            # Gone already, or extended: a later heap entry holds its deadline
+            if task is None or task["expires"] > now:
+                continue
+            # Never delete files out from under a zip that is still being sent
+            if task["zip_streams"]:
+                task["expires"] = now + TASK_TTL_SECONDS
+                heapq.heappush(task_expiry_heap, (task["expires"], tid))
+                continue
             del tasks[tid]
+            expired.append(tid)
+
+    # Directory removal can be slow; keep it out of the critical section
+    for tid in expired:
+        shutil.rmtree(DOWNLOAD_DIR / tid, ignore_errors=True)
+
+
+def prune_api_cache():
+    now = time.monotonic()
+    with api_cache_lock:
+        for key in [k for k, (ts, _) in api_cache.items() if now - ts >= API_CACHE_TTL_SECONDS]:
+            del api_cache[key]
+
+
+def _janitor():
+    while True:
+        time.sleep(CLEANUP_INTERVAL_SECONDS)
+        cleanup_old_tasks()
+        prune_api_cache()
+
+
+threading.Thread(target=_janitor, daemon=True).start()
 
 
 @app.route("/")
@@ -330,21 +683,14 @@ def index():
 
 @app.route("/download", methods=["POST"])
 def start_download():
-    cleanup_old_tasks()
-
     data = request.get_json()
     raw_input = data.get("username", "").strip()
 
     if not raw_input:
         return jsonify({"error": "Please provide an Instagram username or URL"}), 400
 
-    username = raw_input.replace("@", "")
-    if "instagram.com" in username:
-        parts = username.split("instagram.com/")
-        if len(parts) > 1:
-            username = parts[1].split("/")[0].split("?")[0]
-
-    username = username.strip("/").strip()
+    match = _USERNAME_RE.match(raw_input)
+    username = (match.group(1) or match.group(2)) if match else ""
     if not username:
         return jsonify({"error": "Could not extract username"}), 400
 
@@ -353,18 +699,23 @@ def start_download():
 
     task_id = str(uuid.uuid4())[:8]
 
+    expires = time.monotonic() + TASK_TTL_SECONDS
     with tasks_lock:
         tasks[task_id] = {
+            "cond": threading.Condition(threading.Lock()),
             "status": "starting",
             "progress": 0,
-            "messages": [],
+            "messages": deque(maxlen=MAX_TASK_MESSAGES),
+            "msg_seq": 0,
             "username": username,
             "total": 0,
             "downloaded": 0,
             "error": None,
-            "zip_path": None,
-            "created": datetime.now(),
+            "videos_dir": None,
+            "zip_streams": 0,
+            "expires": expires,
         }
+        heapq.heappush(task_expiry_heap, (expires, task_id))
 
     def run():
         downloader = WebReelDownloader(task_id)
@@ -378,36 +729,80 @@ def start_download():
 
 @app.route("/progress/<task_id>")
 def progress(task_id):
+    # Resume after the last message the client saw: EventSource sends
+    # Last-Event-ID on reconnect, other clients can pass ?since=<seq>
+    resume_from = request.headers.get("Last-Event-ID") or request.args.get("since", "0")
+    try:
+        start_seq = max(int(resume_from), 0)
+    except ValueError:
+        start_seq = 0
+
     def generate():
-        last_msg_count = 0
+        last_seq = start_seq
+        last_state = None
+        # Field values the client already has; each event carries only changes
+        sent = {}
         while True:
-            with tasks_lock:
-                task = tasks.get(task_id)
-                if not task:
-                    yield f"data: {json.dumps({'error': 'Task not found'})}\n\n"
-                    return
+            task = tasks.get(task_id)
+            if not task:
+                yield b"data: " + orjson.dumps({"error": "Task not found"}) + b"\n\n"
+                return
 
-                new_messages = task["messages"][last_msg_count:]
-                last_msg_count = len(task["messages"])
-
-                payload = {
-                    "status": task["status"],
-                    "progress": task["progress"],
-                    "messages": new_messages,
-                    "total": task.get("total", 0),
-                    "downloaded": task.get("downloaded", 0),
-                    "error": task.get("error"),
-                    "zip_size": task.get("zip_size"),
-                    "zip_filename": task.get("zip_filename"),
+            # Snapshot references under the lock; build and encode the payload after
+            snapshot = None
+            with task["cond"]:
+                def current_state():
+                    return (task["status"], task["progress"], task["downloaded"], task["msg_seq"])
+
+                # Sleep until the downloader commits a change, or time out for a keepalive;
+                # each stream checks its own last state, so concurrent viewers can't miss one
+                state = current_state()
+                if state == last_state:
+                    task["cond"].wait_for(lambda: current_state() != last_state, SSE_KEEPALIVE_SECONDS)
+                    state = current_state()
+                if state != last_state:
+                    last_state = state
+                    # Walk back from the newest (seq, text) entry to the last one sent
+                    new_messages = []
+                    for seq, text in reversed(task["messages"]):
+                        if seq <= last_seq:
+                            break
+                        new_messages.append(text)
+                    new_messages.reverse()
+                    last_seq = task["msg_seq"]
+                    snapshot = (
+                        new_messages,
+                        task.get("total", 0),
+                        task.get("error"),
+                        task.get("zip_size"),
+                        task.get("zip_filename"),
+                    )
+
+            payload = None
+            if snapshot is not None:
+                new_messages, total, error, zip_size, zip_filename = snapshot
+                status, progress_pct, downloaded, _ = last_state
+                fields = {
+                    "status": status,
+                    "progress": progress_pct,
+                    "total": total,
+                    "downloaded": downloaded,
+                    "error": error,
+                    "zip_size": zip_size,
+                    "zip_filename": zip_filename,
                 }
+                changed = {k: v for k, v in fields.items() if k not in sent or sent[k] != v}
+                sent.update(changed)
+                payload = {"messages": new_messages, "seq": last_seq, **changed}
 
-            yield f"data: {json.dumps(payload)}\n\n"
+            if payload is not None:
+                yield b"id: %d\ndata: " % last_seq + orjson.dumps(payload) + b"\n\n"
+            else:
+                yield b": keepalive\n\n"
 
-            if task["status"] in ("done", "error"):
+            if last_state[0] in ("done", "error"):
                 return
 
-            time.sleep(1)
-
     return Response(
         stream_with_context(generate()),
         mimetype="text/event-stream",
@@ -417,25 +812,41 @@ def progress(task_id):
 
 @app.route("/download/<task_id>")
 def download_zip(task_id):
-    with tasks_lock:
-        task = tasks.get(task_id)
-
-    if not task or task["status"] != "done" or not task.get("zip_path"):
+    task = tasks.get(task_id)
+    if not task or task["status"] != "done" or not task.get("videos_dir"):
         return jsonify({"error": "Download not ready"}), 404
 
-    zip_path = task["zip_path"]
-    if not os.path.exists(zip_path):
+    videos_dir = Path(task["videos_dir"])
+    if not videos_dir.is_dir():
         return jsonify({"error": "File expired, please re-download"}), 404
 
-    return send_file(
-        zip_path,
+    # Every entry's size and CRC was recorded as it was written, so the
+    # archive's length is known before the first byte is sent
+    parts, length = zip_layout(task["zip_entries"])
+    zip_filename = task.get("zip_filename", "reels.zip")
+    # Files are opened one by one as the stream reaches them, so keep them
+    # around for a full TTL from now and for as long as any stream is open
+    _extend_expiry(task_id)
+
+    def send():
+        with tasks_lock:
+            task["zip_streams"] += 1
+        try:
+            yield from stream_zip(videos_dir, parts)
+        finally:
+            with tasks_lock:
+                task["zip_streams"] -= 1
+
+    return Response(
+        stream_with_context(send()),
         mimetype="application/zip",
-        as_attachment=True,
-        download_name=task.get("zip_filename", "reels.zip"),
+        headers={
+            "Content-Disposition": f'attachment; filename="{zip_filename}"',
+            "Content-Length": str(length),
+        },
     )
 
 
 if __name__ == "__main__":
-    DOWNLOAD_DIR.mkdir(parents=True, exist_ok=True)
     port = int(os.environ.get("PORT", 5000))
     app.run(host="0.0.0.0", port=port, debug=False)
@@ -11,11 +11,21 @@ Example:
 
 import instaloader
 import os
+import re
 import sys
 from pathlib import Path
-import time
 from typing import Optional
 
+# Side files Instaloader may leave next to a downloaded reel
+JUNK_EXTENSIONS = {'.txt', '.json', '.xz', '.jpg', '.png'}
+
+# Characters that are not allowed in filenames, mapped to "_"
+_SANITIZE_TABLE = str.maketrans({c: '_' for c in '<>:"/\\|?*\n\r'})
+_MULTI_UNDERSCORE_RE = re.compile(r'_+')
+# Hashtags are whole words starting with '#'
+_HASHTAG_RE = re.compile(r'(?<!\S)#\S*')
+_WS_RE = re.compile(r'\s+')
+
 class InstaReelDownloader:
     def __init__(self, output_dir: str = "videos"):
         """
@@ -69,16 +79,9 @@ class InstaReelDownloader:
         Returns:
             Sanitized filename safe for filesystem
         """
-        # Remove or replace invalid characters
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            filename = filename.replace(char, '_')
-        
-        # Limit length
-        if len(filename) > 200:
-            filename = filename[:200]
-        
-        return filename.strip()
+        # Replace invalid characters in one pass, collapse runs, limit length
+        filename = _MULTI_UNDERSCORE_RE.sub('_', filename.translate(_SANITIZE_TABLE))
+        return filename[:150].strip(' _')
     
     def download_reels(self, username: str):
         """
@@ -108,22 +111,25 @@ class InstaReelDownloader:
                 # Check if it's a reel (video)
                 if post.is_video and post.typename == 'GraphVideo':
                     try:
+                        # Post properties are lazy; read them once per reel
+                        caption = post.caption or ''
+                        shortcode = post.shortcode
+                        date_utc = post.date_utc
+                        
                         # Get reel title/caption (first line or use shortcode)
-                        if post.caption:
-                            # Use first line of caption as title
-                            title = post.caption.split('\n')[0]
-                            # Remove hashtags from title
-                            title = ' '.join(word for word in title.split() if not word.startswith('#'))
+                        if caption:
+                            # Use first line of caption as title, without hashtags
+                            title = caption.partition('\n')[0]
+                            title = _WS_RE.sub(' ', _HASHTAG_RE.sub('', title)).strip()
                             # Limit title length
-                            if len(title) > 100:
-                                title = title[:100]
+                            title = title[:100]
                         else:
-                            title = post.shortcode
+                            title = shortcode
                         
                         # Clean the title for filename
                         clean_title = self.sanitize_filename(title)
                         if not clean_title:
-                            clean_title = post.shortcode
+                            clean_title = shortcode
                         
                         # Create filename
                         filename = f"{clean_title}.mp4"
@@ -142,29 +148,27 @@ class InstaReelDownloader:
                         self.loader.download_post(post, target=str(self.output_dir))
                         
                         # Instaloader creates files with specific naming, rename them
-                        # Find the downloaded file
-                        downloaded_files = list(self.output_dir.glob(f"{post.date_utc.strftime('%Y-%m-%d_%H-%M-%S')}_UTC*.mp4"))
-                        if not downloaded_files:
-                            # Try alternative pattern
-                            downloaded_files = list(self.output_dir.glob(f"*{post.shortcode}*.mp4"))
+                        # Scan the output directory once and match both naming patterns
+                        date_prefix = f"{date_utc.strftime('%Y-%m-%d_%H-%M-%S')}_UTC"
+                        with os.scandir(self.output_dir) as it:
+                            entries = [e for e in it if e.name.startswith(date_prefix) or shortcode in e.name]
+                        
+                        # Find the downloaded file, preferring the timestamp pattern
+                        downloaded_files = [e for e in entries if e.name.endswith('.mp4')]
+                        downloaded_files.sort(key=lambda e: not e.name.startswith(date_prefix))
                         
                         if downloaded_files:
                             # Rename to our desired filename
-                            downloaded_files[0].rename(filepath)
+                            os.rename(downloaded_files[0].path, filepath)
                             
                             # Clean up any extra files (json, txt, etc.)
-                            for ext in ['txt', 'json', 'xz']:
-                                for extra_file in self.output_dir.glob(f"{post.date_utc.strftime('%Y-%m-%d_%H-%M-%S')}_UTC*.{ext}"):
-                                    extra_file.unlink()
-                                for extra_file in self.output_dir.glob(f"*{post.shortcode}*.{ext}"):
-                                    extra_file.unlink()
+                            for extra_file in entries:
+                                if os.path.splitext(extra_file.name)[1] in JUNK_EXTENSIONS:
+                                    os.unlink(extra_file.path)
                         
                         reel_count += 1
                         print(f"✅ Downloaded: {filename}\n")
                         
-                        # Rate limiting - be nice to Instagram
-                        time.sleep(2)
-                        
                     except Exception as e:
                         print(f"❌ Error downloading reel: {e}\n")
                         continue